@@ -1,22 +1,59 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import EmailStr
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Tuple
+from contextlib import asynccontextmanager
+from collections import defaultdict, deque, OrderedDict
+import asyncio
+import heapq
 import os
+import statistics
 import logging
+import threading
 import time
+import httpx
+import msgspec
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 from datetime import datetime
 
 # Import from our modules
-from models import ServiceResponse
-from graph_api import get_access_token, get_booking_businesses, get_staff_members_for_business, get_services_for_business
+from models import ServiceResponse, BusinessSlim, ServiceSlim, StaffPage, BusinessPage, ServicePage
+from graph_api import (
+    get_access_token, get_booking_businesses, get_staff_members_for_business, get_services_for_business,
+    batch_graph_requests, collect_pages,
+    create_graph_client, create_login_client, get_graph_client
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared clients and cache sweeper on startup, and stop them on shutdown"""
+    app.state.graph_client = create_graph_client()
+    app.state.login_client = create_login_client()
+    app.state.redis = aioredis.from_url(REDIS_URL, decode_responses=False) if REDIS_URL else None
+    app.state.shared_cache = RedisCache(app.state.redis, cache) if app.state.redis else None
+    sweeper = asyncio.create_task(sweep_expired(cache, CACHE_SWEEP_INTERVAL))
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        await app.state.graph_client.aclose()
+        await app.state.login_client.aclose()
+        if app.state.redis:
+            await app.state.redis.aclose()
+
 # Initialize FastAPI app
-app = FastAPI(title="Microsoft Booking API Service")
+app = FastAPI(
+    title="Microsoft Booking API Service",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,218 +64,485 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Simple in-memory cache implementation
+# Adaptive TTL: keep the last few access times per key and stretch the TTL to cover its usual gap
+ACCESS_HISTORY_SIZE = 16
+ADAPTIVE_TTL_MIN_SAMPLES = 4
+ADAPTIVE_TTL_MAX_FACTOR = 4  # never stretch a TTL beyond this multiple of its base
+
+# Simple in-memory cache implementation, sharded so each shard has its own lock
 class InMemoryCache:
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, max_size: int = 10_000, num_shards: int = 16):
+        # num_shards must be a power of two so the shard index can be taken with a mask
+        # Each shard is an LRU capped at its share of max_size
+        self.shards = [OrderedDict() for _ in range(num_shards)]
+        self.shard_max_size = max(1, max_size // num_shards)
+        # Per-shard min-heaps of (expires_at, key) so sweeps only touch expired entries
+        self.expiry_heaps = [[] for _ in range(num_shards)]
+        # Per-shard LRU of recent access times, kept separately so it survives entry expiry
+        self.access_history = [OrderedDict() for _ in range(num_shards)]
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+        self.shard_mask = num_shards - 1
         self.default_expiry = 3600  # 1 hour in seconds
+        # Fetches currently running, so concurrent misses on a key can share one result
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    def _shard_index(self, key: str) -> int:
+        return hash(key) & self.shard_mask
     
     def get(self, key: str) -> Optional[Any]:
         """Get data from cache if it exists and hasn't expired"""
-        if key not in self.cache:
-            return None
+        now = time.time()
+        index = self._shard_index(key)
+        shard = self.shards[index]
+        with self.locks[index]:
+            self._record_access(index, key, now)
+            item = shard.get(key)
+            if item is None:
+                return None
+            
+            if item["expires_at"] < now:
+                # Item has expired, remove it
+                del shard[key]
+                return None
+            
+            shard.move_to_end(key)
+            return item["data"]
+    
+    def _record_access(self, index: int, key: str, now: float) -> None:
+        history = self.access_history[index].get(key)
+        if history is None:
+            history = self.access_history[index][key] = deque(maxlen=ACCESS_HISTORY_SIZE)
+            while len(self.access_history[index]) > self.shard_max_size:
+                self.access_history[index].popitem(last=False)
+        else:
+            self.access_history[index].move_to_end(key)
+        history.append(now)
+    
+    def adaptive_expiry(self, key: str, base_expiry: int) -> float:
+        """Stretch the base expiry to mean + 2 stddev of the key's gaps between accesses"""
+        index = self._shard_index(key)
+        with self.locks[index]:
+            history = list(self.access_history[index].get(key, ()))
         
-        item = self.cache[key]
-        if item["expires_at"] < time.time():
-            # Item has expired, remove it
-            del self.cache[key]
-            return None
+        gaps = [later - earlier for earlier, later in zip(history, history[1:])]
+        if len(gaps) < ADAPTIVE_TTL_MIN_SAMPLES:
+            return base_expiry
         
-        return item["data"]
+        mean = statistics.fmean(gaps)
+        expiry = mean + 2 * statistics.pstdev(gaps, mean)
+        return min(max(base_expiry, expiry), base_expiry * ADAPTIVE_TTL_MAX_FACTOR)
     
-    def set(self, key: str, data: Any, expire_seconds: int = None) -> None:
-        """Set data in cache with expiration"""
+    def set(self, key: str, data: Any, expire_seconds: int = None, adaptive: bool = True) -> None:
+        """Set data in cache with expiration, adapted to the key's access pattern unless disabled"""
         if expire_seconds is None:
             expire_seconds = self.default_expiry
+        if adaptive:
+            expire_seconds = self.adaptive_expiry(key, expire_seconds)
         
-        self.cache[key] = {
-            "data": data,
-            "expires_at": time.time() + expire_seconds
-        }
+        expires_at = time.time() + expire_seconds
+        index = self._shard_index(key)
+        shard = self.shards[index]
+        with self.locks[index]:
+            shard[key] = {
+                "data": data,
+                "expires_at": expires_at
+            }
+            shard.move_to_end(key)
+            heapq.heappush(self.expiry_heaps[index], (expires_at, key))
+            
+            # Evict least recently used items once the shard is full
+            while len(shard) > self.shard_max_size:
+                shard.popitem(last=False)
+            
+            # Evicted and overwritten entries leave stale heap entries behind, so rebuild the
+            # heap from the live items once it outgrows the shard (amortized O(1) per set)
+            if len(self.expiry_heaps[index]) > 2 * self.shard_max_size:
+                heap = [(item["expires_at"], item_key) for item_key, item in shard.items()]
+                heapq.heapify(heap)
+                self.expiry_heaps[index] = heap
     
     def clear_expired(self) -> None:
-        """Clear expired items from cache"""
+        """Clear expired items from cache, one shard at a time"""
         now = time.time()
-        expired_keys = [k for k, v in self.cache.items() if v["expires_at"] < now]
-        for key in expired_keys:
-            del self.cache[key]
+        for shard, heap, lock in zip(self.shards, self.expiry_heaps, self.locks):
+            with lock:
+                while heap and heap[0][0] < now:
+                    expires_at, key = heapq.heappop(heap)
+                    item = shard.get(key)
+                    # Skip heap entries left behind by a later set() of the same key
+                    if item is not None and item["expires_at"] == expires_at:
+                        del shard[key]
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+    
+    async def single_flight(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch for a key, letting concurrent callers for the same key await the same result"""
+        while key in self._inflight:
+            future = self._inflight[key]
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # If only the leading fetch was cancelled, take over the fetch instead of failing
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no other caller was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
 
 # Initialize cache
-cache = InMemoryCache()
+cache = InMemoryCache(max_size=int(os.getenv("CACHE_MAX_SIZE", "10000")))
+CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "30"))
+
+async def sweep_expired(cache: InMemoryCache, interval: int) -> None:
+    """Periodically clear expired cache items off the request path"""
+    while True:
+        await asyncio.sleep(interval)
+        cache.clear_expired()
+
+# Redis cache shared by all workers, with the in-memory cache as a short-lived L1 in front
+REDIS_URL = os.getenv("REDIS_URL")
+L1_EXPIRY = int(os.getenv("CACHE_L1_EXPIRY_SECONDS", "60"))
+
+class RedisCache:
+    def __init__(self, redis: aioredis.Redis, l1: InMemoryCache, l1_expiry: int = L1_EXPIRY):
+        self.redis = redis
+        self.l1 = l1
+        self.l1_expiry = l1_expiry
+        self.default_expiry = l1.default_expiry
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        """Get a payload from the L1 cache, falling back to Redis"""
+        payload = self.l1.get(key)
+        if payload is not None:
+            return payload
+        
+        try:
+            payload = await self.redis.get(key)
+        except RedisError as e:
+            logger.error(f"Redis cache retrieval error: {e}")
+            return None
+        if payload is None:
+            return None
+        
+        self.l1.set(key, payload, self.l1_expiry, adaptive=False)
+        return payload
+    
+    async def set(self, key: str, payload: bytes, expire_seconds: int = None, adaptive: bool = True) -> None:
+        """Set a payload in Redis and the L1 cache with expiration"""
+        if expire_seconds is None:
+            expire_seconds = self.default_expiry
+        if adaptive:
+            # Access history is tracked by the L1, which sees every lookup
+            expire_seconds = int(self.l1.adaptive_expiry(key, expire_seconds))
+        
+        self.l1.set(key, payload, min(expire_seconds, self.l1_expiry), adaptive=False)
+        try:
+            await self.redis.set(key, payload, ex=expire_seconds)
+        except RedisError as e:
+            logger.error(f"Redis cache storage error: {e}")
 
 # Cache helpers
 def get_cache_key(prefix: str, identifier: str) -> str:
     """Generate a cache key"""
     return f"{prefix}:{identifier}"
 
-def get_from_cache(key: str) -> Optional[Any]:
-    """Get data from cache"""
+# Cached values are serialized JSON bytes, so cache hits are returned without re-encoding
+async def get_from_cache(key: str) -> Optional[bytes]:
+    """Get a serialized payload from cache"""
+    if app.state.shared_cache:
+        return await app.state.shared_cache.get(key)
     return cache.get(key)
 
-def set_in_cache(key: str, data: Any, expire_seconds: int = None) -> None:
-    """Set data in cache with expiration"""
-    cache.set(key, data, expire_seconds)
+async def set_in_cache(key: str, payload: bytes, expire_seconds: int = None, adaptive: bool = True) -> None:
+    """Set a serialized payload in cache with expiration"""
+    if app.state.shared_cache:
+        await app.state.shared_cache.set(key, payload, expire_seconds, adaptive)
+    else:
+        cache.set(key, payload, expire_seconds, adaptive)
 
-# API endpoints
-@app.get("/")
-async def root():
-    return {"message": "Microsoft Booking API Service"}
+# Decoders for the slim views used when the endpoints need to inspect cached data
+staff_decoder = msgspec.json.Decoder(StaffPage)
+business_decoder = msgspec.json.Decoder(BusinessPage)
+service_decoder = msgspec.json.Decoder(ServicePage)
 
-@app.get("/api/health")
-async def health_check():
-    """Health check endpoint"""
-    # Clear expired cache items on health check
-    cache.clear_expired()
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "cache_size": len(cache.cache)
+def decode_cached(key: str, payload: bytes, decode: Callable[[bytes], Any]) -> Any:
+    """Decode a cached payload, reusing the decoded form for as long as the payload is unchanged"""
+    decoded_key = get_cache_key("decoded", key)
+    decoded = cache.get(decoded_key)
+    if decoded is not None and decoded[0] is payload:
+        return decoded[1]
+    
+    data = decode(payload)
+    cache.set(decoded_key, (payload, data))
+    return data
+
+def index_services_by_staff(payload: bytes) -> Dict[str, List[ServiceSlim]]:
+    """Decode a services payload into a staff member ID -> services index"""
+    index = defaultdict(list)
+    for service in service_decoder.decode(payload).value:
+        for staff_id in dict.fromkeys(service.staffMemberIds or ()):
+            index[staff_id].append(service)
+    return dict(index)
+
+# Failed fetches are remembered briefly so repeated requests don't replay a doomed Graph call
+FAILURE_EXPIRY = int(os.getenv("CACHE_FAILURE_EXPIRY_SECONDS", "60"))
+
+def get_cached_failure(key: str) -> Optional[Dict[str, Any]]:
+    """Get the recorded failure for a key, if it failed recently"""
+    return cache.get(get_cache_key("failed", key))
+
+def cache_failure(key: str, status_code: int, detail: Any) -> None:
+    """Record a failed fetch for a key"""
+    failure = {"status": status_code, "detail": detail}
+    cache.set(get_cache_key("failed", key), failure, FAILURE_EXPIRY, adaptive=False)
+
+async def is_partial(key: str) -> bool:
+    """Check whether the cached payload for a key was built with some businesses missing"""
+    return await get_from_cache(get_cache_key("partial", key)) is not None
+
+async def get_or_fetch(
+    key: str,
+    fetch: Callable[[], Awaitable[Tuple[bytes, bool]]],
+    expire_seconds: int = None
+) -> bytes:
+    """
+    Get a payload from cache, or fetch and cache it with concurrent misses sharing a single fetch.
+    fetch returns the payload and whether it is complete; incomplete payloads are only cached briefly.
+    """
+    cached_data = await get_from_cache(key)
+    if cached_data:
+        logger.info(f"Returning {key} from cache")
+        return cached_data
+    
+    failure = get_cached_failure(key)
+    if failure:
+        raise HTTPException(status_code=failure["status"], detail=failure["detail"])
+    
+    async def fetch_and_cache() -> bytes:
+        try:
+            payload, complete = await fetch()
+        except HTTPException as e:
+            cache_failure(key, e.status_code, e.detail)
+            raise
+        if complete:
+            await set_in_cache(key, payload, expire_seconds)
+        else:
+            # Some businesses were skipped or failed, so retry them as soon as their failures expire
+            await set_in_cache(key, payload, FAILURE_EXPIRY, adaptive=False)
+            await set_in_cache(get_cache_key("partial", key), b"1", FAILURE_EXPIRY, adaptive=False)
+        return payload
+    
+    return await cache.single_flight(key, fetch_and_cache)
+
+# Graph ETags are kept well past the payload TTL so an expired entry can be revalidated
+ETAG_EXPIRY = int(os.getenv("CACHE_ETAG_EXPIRY_SECONDS", "86400"))
+
+async def fetch_revalidated(
+    key: str,
+    fetch: Callable[[Optional[str]], Awaitable[Tuple[Optional[Dict[str, Any]], Optional[str]]]]
+) -> bytes:
+    """Fetch a payload with a conditional GET, reusing the previous payload when Graph reports it unchanged"""
+    etag_key = get_cache_key("etag", key)
+    validator = cache.get(etag_key)
+    etag, previous = validator if validator else (None, None)
+    
+    data, etag = await fetch(etag)
+    if data is None:
+        logger.info(f"{key} not modified, extending cached payload")
+        payload = previous
+    else:
+        payload = orjson.dumps(data)
+    
+    if etag:
+        cache.set(etag_key, (etag, payload), ETAG_EXPIRY)
+    return payload
+
+def json_response(payload: bytes) -> Response:
+    """Wrap an already serialized payload in a JSON response"""
+    return Response(content=payload, media_type="application/json")
+
+# Per-business fan-out through the Graph $batch endpoint
+async def fetch_for_all_businesses(
+    resource: str,
+    businesses: List[BusinessSlim],
+    token: str,
+    client: httpx.AsyncClient,
+    label: str
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Fetch a business sub-collection for every business in batches, tagging each item with its business ID.
+    The label doubles as the cache prefix of the per-business entries, so recent failures are shared with them.
+    Returns the items and whether every business was included.
+    """
+    # Skip businesses whose sub-collection failed recently
+    available = [b for b in businesses if not get_cached_failure(get_cache_key(label, b.id))]
+    complete = len(available) == len(businesses)
+    businesses = available
+    requests = [
+        {"method": "GET", "url": f"/bookingBusinesses/{business.id}/{resource}"}
+        for business in businesses
+    ]
+    responses = await batch_graph_requests(requests, token, client)
+    
+    # Follow any @odata.nextLink in the sub-responses, for all businesses concurrently
+    paged = [
+        index for index, response in enumerate(responses)
+        if response.get("status") == 200 and "@odata.nextLink" in response.get("body", {})
+    ]
+    page_results = await asyncio.gather(
+        *[collect_pages(responses[index]["body"], token, client, label) for index in paged],
+        return_exceptions=True
+    )
+    # A failed follow-up page fails only its own business, like a failed sub-response
+    page_errors = {
+        index: result for index, result in zip(paged, page_results) if isinstance(result, Exception)
     }
+    
+    items = []
+    for index, (business, response) in enumerate(zip(businesses, responses)):
+        business_id = business.id
+        error = page_errors.get(index)
+        if error is not None:
+            if isinstance(error, HTTPException):
+                status_code, detail = error.status_code, error.detail
+            else:
+                status_code, detail = 500, f"Failed to fetch {label}: {error}"
+            logger.warning(f"Failed to fetch {label} pages for business {business_id}: {detail}")
+            cache_failure(get_cache_key(label, business_id), status_code, detail)
+            complete = False
+            continue
+        if response.get("status") != 200:
+            detail = f"Failed to fetch {label}: {response.get('body')}"
+            logger.warning(f"Failed to fetch {label} for business {business_id}: {response.get('body')}")
+            cache_failure(get_cache_key(label, business_id), response.get("status", 500), detail)
+            complete = False
+            continue
+        # Add business ID to each item for reference
+        values = response.get("body", {}).get("value", [])
+        for item in values:
+            item["businessId"] = business_id
+        items.extend(values)
+    
+    return items, complete
 
-@app.get("/api/booking/businesses")
-async def get_businesses(token: str = Depends(get_access_token)):
-    """Get all booking businesses"""
+# Cached Graph data, shared by the endpoints
+async def load_businesses(token: str, client: httpx.AsyncClient) -> bytes:
+    """Get the serialized booking businesses, from cache if possible"""
     cache_key = get_cache_key("businesses", "all")
-    cached_data = get_from_cache(cache_key)
     
-    if cached_data:
-        logger.info("Returning businesses from cache")
-        return cached_data
+    async def fetch() -> Tuple[bytes, bool]:
+        return await fetch_revalidated(cache_key, lambda etag: get_booking_businesses(token, client, etag)), True
     
-    data = await get_booking_businesses(token)
-    set_in_cache(cache_key, data)
-    return data
+    return await get_or_fetch(cache_key, fetch)
 
-@app.get("/api/booking/staff")
-async def get_staff_members(business_id: Optional[str] = None, token: str = Depends(get_access_token)):
-    """Get all staff members, optionally filtered by business ID"""
+async def load_staff_members(business_id: Optional[str], token: str, client: httpx.AsyncClient) -> bytes:
+    """Get the serialized staff members, for one business or all of them, from cache if possible"""
     cache_key = get_cache_key("staff", business_id or "all")
-    cached_data = get_from_cache(cache_key)
     
-    if cached_data:
-        logger.info("Returning staff members from cache")
-        return cached_data
-    
-    # If no business ID provided, get all businesses first
-    if not business_id:
-        businesses_response = await get_businesses(token)
-        businesses = businesses_response.get("value", [])
+    async def fetch() -> Tuple[bytes, bool]:
+        # If no business ID provided, get all businesses first
+        if not business_id:
+            businesses_key = get_cache_key("businesses", "all")
+            businesses_payload = await load_businesses(token, client)
+            businesses = decode_cached(businesses_key, businesses_payload, business_decoder.decode).value
+            
+            all_staff, complete = await fetch_for_all_businesses(
+                "staffMembers", businesses, token, client, "staff"
+            )
+            return orjson.dumps({"value": all_staff}), complete
         
-        all_staff = []
-        for business in businesses:
-            business_id = business["id"]
-            try:
-                staff_data = await get_staff_members_for_business(business_id, token)
-                # Add business ID to each staff member for reference
-                for staff in staff_data.get("value", []):
-                    staff["businessId"] = business_id
-                all_staff.extend(staff_data.get("value", []))
-            except HTTPException as e:
-                logger.warning(f"Failed to fetch staff for business {business_id}: {e.detail}")
-        
-        result = {"value": all_staff}
-        set_in_cache(cache_key, result)
-        return result
+        # If business ID is provided, get staff for that business
+        return await fetch_revalidated(
+            cache_key, lambda etag: get_staff_members_for_business(business_id, token, client, etag)
+        ), True
     
-    # If business ID is provided, get staff for that business
-    data = await get_staff_members_for_business(business_id, token)
-    set_in_cache(cache_key, data)
-    return data
+    return await get_or_fetch(cache_key, fetch)
 
-@app.get("/api/booking/services")
-async def get_services(business_id: Optional[str] = None, token: str = Depends(get_access_token)):
-    """Get all services, optionally filtered by business ID"""
+async def load_services(business_id: Optional[str], token: str, client: httpx.AsyncClient) -> bytes:
+    """Get the serialized services, for one business or all of them, from cache if possible"""
     cache_key = get_cache_key("services", business_id or "all")
-    cached_data = get_from_cache(cache_key)
-    
-    if cached_data:
-        logger.info("Returning services from cache")
-        return cached_data
     
-    # If no business ID provided, get all businesses first
-    if not business_id:
-        businesses_response = await get_businesses(token)
-        businesses = businesses_response.get("value", [])
+    async def fetch() -> Tuple[bytes, bool]:
+        # If no business ID provided, get all businesses first
+        if not business_id:
+            businesses_key = get_cache_key("businesses", "all")
+            businesses_payload = await load_businesses(token, client)
+            businesses = decode_cached(businesses_key, businesses_payload, business_decoder.decode).value
+            
+            all_services, complete = await fetch_for_all_businesses(
+                "services", businesses, token, client, "services"
+            )
+            return orjson.dumps({"value": all_services}), complete
         
-        all_services = []
-        for business in businesses:
-            business_id = business["id"]
-            try:
-                services_data = await get_services_for_business(business_id, token)
-                # Add business ID to each service for reference
-                for service in services_data.get("value", []):
-                    service["businessId"] = business_id
-                all_services.extend(services_data.get("value", []))
-            except HTTPException as e:
-                logger.warning(f"Failed to fetch services for business {business_id}: {e.detail}")
-        
-        result = {"value": all_services}
-        set_in_cache(cache_key, result)
-        return result
+        # If business ID is provided, get services for that business
+        return await fetch_revalidated(
+            cache_key, lambda etag: get_services_for_business(business_id, token, client, etag)
+        ), True
     
-    # If business ID is provided, get services for that business
-    data = await get_services_for_business(business_id, token)
-    set_in_cache(cache_key, data)
-    return data
+    return await get_or_fetch(cache_key, fetch)
 
-@app.get("/api/staff/{email}/services", response_model=ServiceResponse)
-async def get_staff_services_by_email(email: EmailStr, token: str = Depends(get_access_token)):
-    """
-    Get services for a staff member by email, grouped by business
-    """
-    cache_key = get_cache_key("staff_services", email)
-    cached_data = get_from_cache(cache_key)
+async def build_staff_services(email: str, token: str, client: httpx.AsyncClient) -> Tuple[bytes, bool]:
+    """Build the serialized services for a staff member, grouped by business, and whether it is complete"""
+    # Load staff members, services and businesses concurrently so their cache misses overlap
+    staff_payload, services_payload, businesses_payload = await asyncio.gather(
+        load_staff_members(None, token, client),
+        load_services(None, token, client),
+        load_businesses(token, client)
+    )
     
-    if cached_data:
-        logger.info(f"Returning staff services from cache for {email}")
-        return cached_data
-    
-    # Get all staff members
-    staff_response = await get_staff_members(token=token)
-    staff_members = staff_response.get("value", [])
+    staff_key = get_cache_key("staff", "all")
+    staff_members = decode_cached(staff_key, staff_payload, staff_decoder.decode).value
     
-    # Find the staff member by email
-    staff_member = None
-    for staff in staff_members:
-        if staff.get("emailAddress", "").lower() == email.lower():
-            staff_member = staff
-            break
+    # Find the staff member by email (reversed so the first match wins, as before)
+    staff_by_email = {
+        staff.emailAddress.lower(): staff
+        for staff in reversed(staff_members)
+        if staff.emailAddress
+    }
+    staff_member = staff_by_email.get(email.lower())
     
     if not staff_member:
         raise HTTPException(status_code=404, detail=f"Staff member with email {email} not found")
     
-    staff_id = staff_member["id"]
+    staff_id = staff_member.id
     
-    # Get all services
-    services_response = await get_services(token=token)
-    all_services = services_response.get("value", [])
+    # Services for this staff member, from an index rebuilt only when the services payload changes
+    index_key = get_cache_key("services_by_staff", "all")
+    staff_services = decode_cached(index_key, services_payload, index_services_by_staff).get(staff_id, [])
     
-    # Filter services for this staff member
-    staff_services = []
-    for service in all_services:
-        staff_member_ids = service.get("staffMemberIds", [])
-        if staff_id in staff_member_ids:
-            staff_services.append(service)
-    
-    # Get all businesses
-    businesses_response = await get_businesses(token=token)
-    businesses = {b["id"]: b for b in businesses_response.get("value", [])}
+    businesses_key = get_cache_key("businesses", "all")
+    businesses = {
+        b.id: b for b in decode_cached(businesses_key, businesses_payload, business_decoder.decode).value
+    }
     
     # Group services by business
-    services_by_business = {}
+    services_by_business = defaultdict(list)
     for service in staff_services:
-        business_id = service.get("businessId")
-        if business_id not in services_by_business:
-            services_by_business[business_id] = []
-        services_by_business[business_id].append(service)
+        services_by_business[service.businessId].append(service)
     
     # Format the response
     services_grouped = []
     for business_id, services in services_by_business.items():
-        business = businesses.get(business_id, {"displayName": "Unknown Business"})
+        business = businesses.get(business_id)
         services_grouped.append({
             "businessId": business_id,
-            "businessName": business.get("displayName"),
+            "businessName": business.displayName if business else "Unknown Business",
             "services": services
         })
     
@@ -247,13 +551,87 @@ async def get_staff_services_by_email(email: EmailStr, token: str = Depends(get_
         "servicesByBusiness": services_grouped
     }
     
-    # Cache the result
-    set_in_cache(cache_key, result, 1800)  # Cache for 30 minutes
+    # Results built from partial aggregates are only cached briefly, like the aggregates themselves
+    complete = not (await is_partial(staff_key) or await is_partial(get_cache_key("services", "all")))
     
-    return result
+    # The result is built from Graph data we already trust, so it is serialized without model validation
+    return msgspec.json.encode(result), complete
+
+# API endpoints
+@app.get("/")
+async def root():
+    return {"message": "Microsoft Booking API Service"}
+
+@app.get("/api/health")
+async def health_check():
+    """Health check endpoint"""
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "cache_size": len(cache)
+    }
+
+@app.get("/api/booking/businesses")
+async def get_businesses(
+    token: str = Depends(get_access_token),
+    client: httpx.AsyncClient = Depends(get_graph_client)
+):
+    """Get all booking businesses"""
+    return json_response(await load_businesses(token, client))
+
+@app.get("/api/booking/staff")
+async def get_staff_members(
+    business_id: Optional[str] = None,
+    token: str = Depends(get_access_token),
+    client: httpx.AsyncClient = Depends(get_graph_client)
+):
+    """Get all staff members, optionally filtered by business ID"""
+    return json_response(await load_staff_members(business_id, token, client))
+
+@app.get("/api/booking/services")
+async def get_services(
+    business_id: Optional[str] = None,
+    token: str = Depends(get_access_token),
+    client: httpx.AsyncClient = Depends(get_graph_client)
+):
+    """Get all services, optionally filtered by business ID"""
+    return json_response(await load_services(business_id, token, client))
+
+# ServiceResponse documents the response shape; it is not used to revalidate the built result
+@app.get(
+    "/api/staff/{email}/services",
+    response_model=None,
+    responses={200: {"model": ServiceResponse}}
+)
+async def get_staff_services_by_email(
+    email: EmailStr,
+    token: str = Depends(get_access_token),
+    client: httpx.AsyncClient = Depends(get_graph_client)
+):
+    """
+    Get services for a staff member by email, grouped by business
+    """
+    cache_key = get_cache_key("staff_services", email)
+    payload = await get_or_fetch(
+        cache_key,
+        lambda: build_staff_services(email, token, client),
+        1800  # Cache for 30 minutes
+    )
+    return json_response(payload)
 
 # Run the application with uvicorn
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=True)
+    # Autoreload is for local development only and cannot run multiple workers
+    reload = os.getenv("RELOAD", "0") == "1"
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2))
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        reload=reload,
+        workers=1 if reload else workers,
+        loop="uvloop",
+        http="httptools"
+    )
 
@@ -1,9 +1,13 @@
 import os
 import logging
+import asyncio
+import time
 import httpx
-from fastapi import HTTPException
-from functools import lru_cache
-from typing import Dict, List, Optional, Any
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from fastapi import HTTPException, Depends, Request
+from typing import Dict, List, Optional, Any, Tuple, AsyncIterator
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -11,44 +15,123 @@ logger = logging.getLogger(__name__)
 # Configuration
 class GraphSettings:
     MS_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
-    MS_USERNAME = os.getenv("MS_USERNAME")
-    MS_PASSWORD = os.getenv("MS_PASSWORD")
-    MS_TENANT_ID = os.getenv("MS_TENANT_ID", "common")
+    MS_LOGIN_BASE_URL = "https://login.microsoftonline.com"
+    MS_GRAPH_BATCH_SIZE = 20  # Graph accepts at most 20 sub-requests per $batch call
+    MS_CLIENT_ID = os.getenv("MS_CLIENT_ID")
+    MS_CLIENT_SECRET = os.getenv("MS_CLIENT_SECRET")
+    MS_TENANT_ID = os.getenv("MS_TENANT_ID")
 
 settings = GraphSettings()
 
+# Shared HTTP clients, created once in the app lifespan and reused across requests
+def create_graph_client() -> httpx.AsyncClient:
+    """Create the pooled HTTP/2 client used for all Graph API calls"""
+    # Graph is a single host, so a few multiplexed HTTP/2 connections carry the whole fan-out
+    return httpx.AsyncClient(
+        base_url=settings.MS_GRAPH_BASE_URL,
+        http2=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=120),
+        timeout=httpx.Timeout(30.0, connect=10.0)
+    )
+
+def create_login_client() -> httpx.AsyncClient:
+    """Create the pooled client used for token requests"""
+    return httpx.AsyncClient(
+        base_url=settings.MS_LOGIN_BASE_URL,
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=10.0)
+    )
+
+def get_graph_client(request: Request) -> httpx.AsyncClient:
+    """Dependency returning the shared Graph API client"""
+    return request.app.state.graph_client
+
+def get_login_client(request: Request) -> httpx.AsyncClient:
+    """Dependency returning the shared login client"""
+    return request.app.state.login_client
+
+def get_redis_client(request: Request) -> Optional[aioredis.Redis]:
+    """Dependency returning the shared Redis client, or None when Redis is not configured"""
+    return request.app.state.redis
+
+# Cached access token, refreshed shortly before it expires
+# When Redis is configured the token is also shared between workers
+TOKEN_REFRESH_MARGIN = 60  # seconds
+TOKEN_REDIS_KEY = "graph:access_token"
+_token_state = {"token": None, "exp": 0.0}
+_token_lock = asyncio.Lock()
+
 # Authentication helper
-@lru_cache(maxsize=1)
-async def get_access_token():
+async def get_access_token(
+    client: httpx.AsyncClient = Depends(get_login_client),
+    redis: Optional[aioredis.Redis] = Depends(get_redis_client)
+) -> str:
+    """Get a Microsoft Graph API access token, reusing the cached one until it is about to expire"""
+    if _token_state["exp"] > time.monotonic():
+        return _token_state["token"]
+    
+    async with _token_lock:
+        # Another request may have refreshed the token while we waited for the lock
+        if _token_state["exp"] > time.monotonic():
+            return _token_state["token"]
+        
+        if redis and await load_shared_token(redis):
+            return _token_state["token"]
+        
+        token_data = await request_access_token(client)
+        expires_in = int(token_data.get("expires_in", 3600)) - TOKEN_REFRESH_MARGIN
+        _token_state["token"] = token_data["access_token"]
+        _token_state["exp"] = time.monotonic() + expires_in
+        
+        if redis:
+            try:
+                await redis.set(TOKEN_REDIS_KEY, _token_state["token"], ex=max(expires_in, 1))
+            except RedisError as e:
+                logger.error(f"Failed to share access token: {e}")
+        
+        return _token_state["token"]
+
+async def load_shared_token(redis: aioredis.Redis) -> bool:
+    """Load a token refreshed by another worker from Redis, returning whether one was found"""
+    try:
+        token, ttl_ms = await redis.pipeline(transaction=False).get(TOKEN_REDIS_KEY).pttl(TOKEN_REDIS_KEY).execute()
+    except RedisError as e:
+        logger.error(f"Failed to load shared access token: {e}")
+        return False
+    
+    if token is None or ttl_ms <= 0:
+        return False
+    
+    _token_state["token"] = token.decode() if isinstance(token, bytes) else token
+    _token_state["exp"] = time.monotonic() + ttl_ms / 1000
+    return True
+
+async def request_access_token(client: httpx.AsyncClient) -> Dict[str, Any]:
     """
-    Get Microsoft Graph API access token using username and password
-    This approach is suitable for testing but not recommended for production
+    Request a new Microsoft Graph API access token with the client credentials flow
+    The app registration needs Graph application permissions for Bookings
     """
-    if not settings.MS_USERNAME or not settings.MS_PASSWORD:
+    if not settings.MS_CLIENT_ID or not settings.MS_CLIENT_SECRET or not settings.MS_TENANT_ID:
         raise HTTPException(
             status_code=500,
-            detail="Authentication not configured. Set MS_USERNAME and MS_PASSWORD environment variables."
+            detail="Authentication not configured. Set MS_CLIENT_ID, MS_CLIENT_SECRET and MS_TENANT_ID environment variables."
         )
     
-    # Using the Resource Owner Password Credentials flow
-    # This is not recommended for production applications
-    token_url = f"https://login.microsoftonline.com/{settings.MS_TENANT_ID}/oauth2/v2.0/token"
+    # Client credentials need a specific tenant rather than "common"
+    token_url = f"/{settings.MS_TENANT_ID}/oauth2/v2.0/token"
     
     # Prepare the request body
     data = {
-        "grant_type": "password",
-        "client_id": "1950a258-227b-4e31-a9cf-717495945fc2",  # Microsoft's Resource Explorer App ID
-        "scope": "https://graph.microsoft.com/.default",
-        "username": settings.MS_USERNAME,
-        "password": settings.MS_PASSWORD
+        "grant_type": "client_credentials",
+        "client_id": settings.MS_CLIENT_ID,
+        "client_secret": settings.MS_CLIENT_SECRET,
+        "scope": "https://graph.microsoft.com/.default"
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, data=data)
-            response.raise_for_status()
-            token_data = response.json()
-            return token_data["access_token"]
+        response = await client.post(token_url, data=data)
+        response.raise_for_status()
+        return orjson.loads(response.content)
     except httpx.HTTPStatusError as e:
         logger.error(f"Failed to get access token: {e.response.text}")
         raise HTTPException(
@@ -63,54 +146,128 @@ async def get_access_token():
         )
 
 # Graph API requests
-async def get_booking_businesses(token: str) -> Dict[str, Any]:
-    """Get all booking businesses from Microsoft Graph API"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{settings.MS_GRAPH_BASE_URL}/bookingBusinesses",
-            headers={"Authorization": f"Bearer {token}"}
+# Each returns (data, etag); data is None when the resource is unchanged since the given etag
+async def get_graph_resource(
+    url: str,
+    token: str,
+    client: httpx.AsyncClient,
+    etag: Optional[str],
+    label: str
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Get a Graph resource, revalidating with If-None-Match when an etag is known"""
+    headers = {"Authorization": f"Bearer {token}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    
+    response = await client.get(url, headers=headers)
+    
+    if response.status_code == 304:
+        return None, etag
+    
+    if response.status_code != 200:
+        logger.error(f"Failed to fetch {label}: {response.text}")
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Failed to fetch {label}: {response.text}"
         )
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch businesses: {response.text}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Failed to fetch booking businesses: {response.text}"
-            )
-        
-        return response.json()
+    
+    page = orjson.loads(response.content)
+    # The ETag only covers the first page, so paged collections are never revalidated with it
+    etag = None if page.get("@odata.nextLink") else response.headers.get("ETag")
+    page = await collect_pages(page, token, client, label)
+    return page, etag
+
+# Pagination
+async def fetch_pages(next_link: str, token: str, client: httpx.AsyncClient, label: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield the values of each page from next_link on, requesting the following page before yielding"""
+    headers = {"Authorization": f"Bearer {token}"}
+    pending = asyncio.create_task(client.get(next_link, headers=headers))
+    try:
+        while pending:
+            response = await pending
+            pending = None
+            
+            if response.status_code != 200:
+                logger.error(f"Failed to fetch {label} page: {response.text}")
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"Failed to fetch {label}: {response.text}"
+                )
+            
+            page = orjson.loads(response.content)
+            if page.get("@odata.nextLink"):
+                pending = asyncio.create_task(client.get(page["@odata.nextLink"], headers=headers))
+            yield page.get("value", [])
+    finally:
+        if pending:
+            pending.cancel()
+
+async def collect_pages(page: Dict[str, Any], token: str, client: httpx.AsyncClient, label: str) -> Dict[str, Any]:
+    """Extend a first page's values with every following page, following @odata.nextLink"""
+    next_link = page.pop("@odata.nextLink", None)
+    if next_link:
+        async for values in fetch_pages(next_link, token, client, label):
+            page.setdefault("value", []).extend(values)
+    return page
+
+async def get_booking_businesses(
+    token: str,
+    client: httpx.AsyncClient,
+    etag: Optional[str] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Get all booking businesses from Microsoft Graph API"""
+    return await get_graph_resource("/bookingBusinesses", token, client, etag, "booking businesses")
 
-async def get_staff_members_for_business(business_id: str, token: str) -> Dict[str, Any]:
+async def get_staff_members_for_business(
+    business_id: str,
+    token: str,
+    client: httpx.AsyncClient,
+    etag: Optional[str] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     """Get staff members for a specific business"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{settings.MS_GRAPH_BASE_URL}/bookingBusinesses/{business_id}/staffMembers",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch staff: {response.text}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Failed to fetch staff members: {response.text}"
-            )
-        
-        return response.json()
+    return await get_graph_resource(
+        f"/bookingBusinesses/{business_id}/staffMembers", token, client, etag, "staff members"
+    )
 
-async def get_services_for_business(business_id: str, token: str) -> Dict[str, Any]:
+async def get_services_for_business(
+    business_id: str,
+    token: str,
+    client: httpx.AsyncClient,
+    etag: Optional[str] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     """Get services for a specific business"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{settings.MS_GRAPH_BASE_URL}/bookingBusinesses/{business_id}/services",
+    return await get_graph_resource(
+        f"/bookingBusinesses/{business_id}/services", token, client, etag, "services"
+    )
+
+async def batch_graph_requests(requests: List[Dict[str, Any]], token: str, client: httpx.AsyncClient) -> List[Dict[str, Any]]:
+    """
+    Send sub-requests through the Graph $batch endpoint, chunked to the batch size limit.
+    Returns one sub-response ({"id", "status", "headers", "body"}) per request, in request order.
+    """
+    async def send_batch(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        payload = {"requests": [{"id": str(i), **request} for i, request in enumerate(chunk)]}
+        response = await client.post(
+            "/$batch",
+            json=payload,
             headers={"Authorization": f"Bearer {token}"}
         )
         
         if response.status_code != 200:
-            logger.error(f"Failed to fetch services: {response.text}")
+            logger.error(f"Failed to send batch request: {response.text}")
             raise HTTPException(
                 status_code=response.status_code,
-                detail=f"Failed to fetch services: {response.text}"
+                detail=f"Failed to send batch request: {response.text}"
             )
         
-        return response.json()
-
+        # Sub-responses may come back in any order, so reassemble them by ID
+        responses_by_id = {r["id"]: r for r in orjson.loads(response.content).get("responses", [])}
+        return [
+            responses_by_id.get(str(i), {"id": str(i), "status": 500, "body": "Missing batch response"})
+            for i in range(len(chunk))
+        ]
+    
+    size = settings.MS_GRAPH_BATCH_SIZE
+    chunks = [requests[i:i + size] for i in range(0, len(requests), size)]
+    results = await asyncio.gather(*[send_batch(chunk) for chunk in chunks])
+    return [response for chunk_responses in results for response in chunk_responses]
@@ -1,5 +1,6 @@
+import msgspec
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Any, List, Optional
 
 class StaffMember(BaseModel):
     id: str
@@ -34,3 +35,32 @@ class ServiceResponse(BaseModel):
     staffMember: StaffMember
     servicesByBusiness: List[ServicesByBusiness]
 
+# Slim views of Graph collections, decoded straight from cached payloads with only the fields we use
+class StaffSlim(msgspec.Struct):
+    id: str
+    displayName: Optional[str] = None
+    emailAddress: Optional[str] = None
+    role: Optional[str] = None
+    useBusinessHours: Optional[bool] = None
+    businessId: Optional[str] = None
+
+class BusinessSlim(msgspec.Struct):
+    id: str
+    displayName: Optional[str] = None
+
+class ServiceSlim(msgspec.Struct):
+    id: str
+    displayName: Optional[str] = None
+    description: Optional[str] = None
+    defaultDuration: Any = None
+    businessId: Optional[str] = None
+    staffMemberIds: Optional[List[str]] = None
+
+class StaffPage(msgspec.Struct):
+    value: List[StaffSlim] = []
+
+class BusinessPage(msgspec.Struct):
+    value: List[BusinessSlim] = []
+
+class ServicePage(msgspec.Struct):
+    value: List[ServiceSlim] = []
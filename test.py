@@ -5,14 +5,17 @@ import shutil
 # Define the project structure and file contents
 project = {
     "requirements.txt": """fastapi==0.109.2
-uvicorn==0.27.1
+uvicorn[standard]==0.27.1
 redis==5.0.1
+cachetools==5.3.2
+orjson==3.9.15
 pydantic==2.6.1
 pydantic-settings==2.1.0
 email-validator==2.1.0
 python-dotenv==1.0.1
 azure-identity==1.15.0
-msgraph-sdk==1.26.0""",
+msgraph-sdk==1.26.0
+httpx[http2]==0.27.0""",
     
     "Dockerfile": """FROM python:3.11-slim
 
@@ -23,8 +26,11 @@ RUN pip install --no-cache-dir -r requirements.txt
 
 COPY . .
 
+# Number of worker processes (can be overridden from Azure App Service settings)
+ENV WORKERS=4
+
 # Use environment variables from Azure App Service
-CMD ["uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"]""",
+CMD ["sh", "-c", "uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers ${WORKERS:-4} --loop uvloop --http httptools --no-access-log --proxy-headers"]""",
     
     ".env.example": """# Microsoft Graph API Authentication
 MS_CLIENT_ID=your_client_id_here
@@ -32,17 +38,32 @@ MS_USERNAME=your_username_here
 MS_PASSWORD=your_password_here
 MS_TENANT_ID=your_tenant_id_here
 
+# Admin API key for cache management endpoints (leave empty to disable them)
+ADMIN_API_KEY=
+
+# Server Configuration
+# Number of uvicorn worker processes in the Docker image (default: 4)
+WORKERS=4
+
 # Cache Configuration
 # Options: "memory" or "redis"
-CACHE_TYPE=memory
-# Redis URL (only needed if CACHE_TYPE=redis)
-REDIS_URL=redis://localhost:6379/0
+# The memory cache is per process and is only suitable for a single worker;
+# with WORKERS > 1 and CACHE_TYPE left unset, the service switches to Redis when REDIS_URL is set
+# CACHE_TYPE=memory
+# Redis URL (needed if CACHE_TYPE=redis or when running multiple workers)
+# REDIS_URL=redis://localhost:6379/0
 # Cache TTL in seconds (default: 3600 = 1 hour)
 CACHE_TTL_SECONDS=3600
+# Per-entity cache TTLs in seconds
+TTL_BUSINESSES=3600
+TTL_STAFF=600
+TTL_SERVICES=1800
+TTL_STAFF_SERVICES=1800
 # Maximum number of items in memory cache (0 = unlimited, default: 0)
 MEMORY_CACHE_MAX_SIZE=0""",
     
-    "run.py": """# Script to run the application
+    "run.py": """# Script to run the application locally with autoreload (development only)
+# Production uses the Dockerfile command, which runs multiple workers without reload
 import uvicorn
 import logging
 
@@ -60,6 +81,8 @@ if __name__ == "__main__":
         host="0.0.0.0", 
         port=8000, 
         reload=True,
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
     logger.info("Shutting down Microsoft Booking API Service")""",
@@ -68,11 +91,15 @@ if __name__ == "__main__":
     
     "app/main.py": """# Main application module
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.config import settings
 from app.api.routes import router
+from app.services.graph_service import GraphService
 
 # Configure logging
 logging.basicConfig(
@@ -81,11 +108,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the Graph service once per worker and close its HTTP client on shutdown
+    app.state.graph = GraphService()
+    yield
+    await app.state.graph.close()
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.api_title,
     description=settings.api_description,
-    version=settings.api_version
+    version=settings.api_version,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -97,6 +133,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON responses (business, staff and service lists) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Include API routes
 app.include_router(router)
 
@@ -107,12 +146,7 @@ async def root():
         "message": "Microsoft Booking API Service",
         "docs": "/docs",
         "version": settings.api_version
-    }
-
-# Run the application with uvicorn
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)""",
+    }""",
     
     "app/config.py": """# Configuration management for the application
 import os
@@ -137,6 +171,9 @@ class Settings(BaseSettings):
     ms_password: str = Field(default=os.environ.get("MS_PASSWORD", ""))
     ms_tenant_id: str = Field(default=os.environ.get("MS_TENANT_ID", ""))
     
+    # Admin API key required by cache management endpoints (empty = endpoints disabled)
+    admin_api_key: str = Field(default=os.environ.get("ADMIN_API_KEY", ""))
+    
     # Cache settings
     cache_type: Literal["memory", "redis"] = Field(
         default=os.environ.get("CACHE_TYPE", "memory")
@@ -144,6 +181,12 @@ class Settings(BaseSettings):
     redis_url: str = Field(default=os.environ.get("REDIS_URL", ""))
     cache_ttl_seconds: int = int(os.environ.get("CACHE_TTL_SECONDS", "3600"))  # Default: 1 hour
     memory_cache_max_size: int = int(os.environ.get("MEMORY_CACHE_MAX_SIZE", "0"))  # 0 = unlimited
+    
+    # Per-entity cache TTLs in seconds, tuned to how often each changes in Bookings
+    ttl_businesses: int = 3600  # 1 hour
+    ttl_staff: int = 600  # 10 minutes
+    ttl_services: int = 1800  # 30 minutes
+    ttl_staff_services: int = 1800  # 30 minutes
 
     # Use SettingsConfigDict instead of Config class in Pydantic v2
     model_config = SettingsConfigDict(env_file=".env")
@@ -154,10 +197,17 @@ settings = Settings()""",
     "app/api/__init__.py": """# API package""",
     
     "app/api/routes.py": """# API routes for the application
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+import secrets
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Request, Security
+from fastapi.responses import Response
+from fastapi.security import APIKeyHeader
 from pydantic import EmailStr
 
+from app.config import settings
 from app.models.schemas import ServiceResponse, ErrorResponse
 from app.services.graph_service import GraphService
 from app.services.cache_service import cache_service
@@ -168,8 +218,64 @@ logger = logging.getLogger(__name__)
 # Create router
 router = APIRouter(prefix="/api")
 
-# Create graph service
-graph_service = GraphService()
+def get_graph_service(request: Request) -> GraphService:
+    # Graph service created in the application lifespan
+    return request.app.state.graph
+
+# Pending cache-miss loads, keyed by cache key
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def _fetch_or_join(key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+    # Run loader for a cache miss, or wait for the load already in flight for this key
+    while key in _inflight:
+        future = _inflight[key]
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # If only the leading load was cancelled, take over the load instead of failing
+            if not future.cancelled() or asyncio.current_task().cancelling():
+                raise
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await loader()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark the exception as retrieved in case nobody joined
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        _inflight.pop(key, None)
+
+async def _get_staff_service_index(graph_service: GraphService, businesses: List[Dict[str, Any]]) -> Dict[str, list]:
+    # Get the staff ID -> [(service, business)] index from cache, building it on a miss
+    index_key = cache_service.get_key("index", "staff_services")
+    cached_index = await cache_service.get(index_key)
+    if cached_index:
+        return orjson.loads(cached_index)
+    
+    async def build_index():
+        # Prefetch cached services for every business in one round-trip
+        service_keys = {b["id"]: cache_service.get_key("services", b["id"]) for b in businesses}
+        cached_services = await cache_service.get_many(list(service_keys.values()))
+        known_services = {
+            business_id: orjson.loads(cached_services[key])["value"]
+            for business_id, key in service_keys.items()
+            if cached_services[key]
+        }
+        
+        index = await graph_service.build_staff_service_index(businesses, known_services)
+        await cache_service.set(index_key, index, settings.ttl_services)
+        return index
+    
+    return await _fetch_or_join(index_key, build_index)
 
 @router.get("/health")
 async def health_check():
@@ -177,19 +283,23 @@ async def health_check():
     return {"status": "healthy"}
 
 @router.get("/booking/businesses")
-async def get_booking_businesses():
+async def get_booking_businesses(graph_service: GraphService = Depends(get_graph_service)):
     # Get all booking businesses
     cache_key = cache_service.get_key("businesses", "all")
-    cached_data = cache_service.get(cache_key)
+    cached_data = await cache_service.get(cache_key)
     
     if cached_data:
         logger.info("Returning businesses from cache")
-        return {"value": cached_data}
+        return Response(content=cached_data, media_type="application/json")
+    
+    async def load_businesses():
+        businesses = await graph_service.get_booking_businesses()
+        result = {"value": businesses}
+        await cache_service.set(cache_key, result, settings.ttl_businesses)
+        return result
     
     try:
-        businesses = graph_service.get_booking_businesses()
-        cache_service.set(cache_key, businesses)
-        return {"value": businesses}
+        return await _fetch_or_join(cache_key, load_businesses)
     
     except Exception as e:
         logger.error(f"Failed to fetch booking businesses: {e}")
@@ -199,19 +309,23 @@ async def get_booking_businesses():
         )
 
 @router.get("/booking/business/{business_id}/staff")
-async def get_staff_members(business_id: str):
+async def get_staff_members(business_id: str, graph_service: GraphService = Depends(get_graph_service)):
     # Get staff members for a specific business
     cache_key = cache_service.get_key("staff", business_id)
-    cached_data = cache_service.get(cache_key)
+    cached_data = await cache_service.get(cache_key)
     
     if cached_data:
         logger.info(f"Returning staff members from cache for business {business_id}")
-        return {"value": cached_data}
+        return Response(content=cached_data, media_type="application/json")
+    
+    async def load_staff_members():
+        staff_members = await graph_service.get_staff_members(business_id)
+        result = {"value": staff_members}
+        await cache_service.set(cache_key, result, settings.ttl_staff)
+        return result
     
     try:
-        staff_members = graph_service.get_staff_members(business_id)
-        cache_service.set(cache_key, staff_members)
-        return {"value": staff_members}
+        return await _fetch_or_join(cache_key, load_staff_members)
     
     except Exception as e:
         logger.error(f"Failed to fetch staff members for business {business_id}: {e}")
@@ -221,19 +335,23 @@ async def get_staff_members(business_id: str):
         )
 
 @router.get("/booking/business/{business_id}/services")
-async def get_services(business_id: str):
+async def get_services(business_id: str, graph_service: GraphService = Depends(get_graph_service)):
     # Get services for a specific business
     cache_key = cache_service.get_key("services", business_id)
-    cached_data = cache_service.get(cache_key)
+    cached_data = await cache_service.get(cache_key)
     
     if cached_data:
         logger.info(f"Returning services from cache for business {business_id}")
-        return {"value": cached_data}
+        return Response(content=cached_data, media_type="application/json")
+    
+    async def load_services():
+        services = await graph_service.get_services(business_id)
+        result = {"value": services}
+        await cache_service.set(cache_key, result, settings.ttl_services)
+        return result
     
     try:
-        services = graph_service.get_services(business_id)
-        cache_service.set(cache_key, services)
-        return {"value": services}
+        return await _fetch_or_join(cache_key, load_services)
     
     except Exception as e:
         logger.error(f"Failed to fetch services for business {business_id}: {e}")
@@ -242,41 +360,53 @@ async def get_services(business_id: str):
             detail=f"Failed to fetch services: {str(e)}"
         )
 
-@router.get("/staff/{email}/services", response_model=ServiceResponse, responses={404: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
-async def get_staff_services_by_email(email: EmailStr):
+# Validation happens once before caching, so the response model is documentation only
+@router.get("/staff/{email}/services", response_model=None, responses={200: {"model": ServiceResponse}, 404: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def get_staff_services_by_email(email: EmailStr, graph_service: GraphService = Depends(get_graph_service)):
     # Get services for a staff member by email, grouped by business
     cache_key = cache_service.get_key("staff_services", email)
-    cached_data = cache_service.get(cache_key)
+    cached_data = await cache_service.get(cache_key)
     
     if cached_data:
         logger.info(f"Returning staff services from cache for {email}")
-        return cached_data
+        return Response(content=cached_data, media_type="application/json")
     
-    try:
+    async def load_staff_services():
+        # Get all booking businesses, from cache when possible
+        cached_businesses = await cache_service.get(cache_service.get_key("businesses", "all"))
+        if cached_businesses:
+            businesses = orjson.loads(cached_businesses)["value"]
+        else:
+            businesses = await graph_service.get_booking_businesses()
+        
         # Find the staff member by email
-        staff_member, _ = graph_service.find_staff_member_by_email(email)
+        staff_member, _ = await graph_service.find_staff_member_by_email(email, businesses)
         
         if not staff_member:
             raise HTTPException(status_code=404, detail=f"Staff member with email {email} not found")
         
-        # Get services for this staff member
-        services_with_businesses = graph_service.get_services_for_staff(staff_member["id"])
+        # Get services for this staff member from the reverse index
+        index = await _get_staff_service_index(graph_service, businesses)
+        services_with_businesses = index.get(staff_member["id"], [])
         
         # Group services by business
         from app.utils.helpers import group_services_by_business
         services_by_business = group_services_by_business(services_with_businesses)
         
-        # Format the response
-        result = {
-            "staffMember": staff_member,
-            "servicesByBusiness": services_by_business
-        }
+        # Format and validate the response
+        result = ServiceResponse(
+            staffMember=staff_member,
+            servicesByBusiness=services_by_business
+        ).model_dump(mode="json")
         
         # Cache the result
-        cache_service.set(cache_key, result, 1800)  # Cache for 30 minutes
+        await cache_service.set(cache_key, result, settings.ttl_staff_services)
         
         return result
     
+    try:
+        return await _fetch_or_join(cache_key, load_staff_services)
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -286,18 +416,30 @@ async def get_staff_services_by_email(email: EmailStr):
             detail=f"Failed to fetch staff services: {str(e)}"
         )
 
+# Admin API key header for cache management
+admin_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+async def require_admin_key(api_key: Optional[str] = Security(admin_key_header)):
+    # Reject requests without the configured admin API key
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=403, detail="Cache administration is disabled")
+    if not api_key or not secrets.compare_digest(api_key, settings.admin_api_key):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
 # Add a cache control endpoint
-@router.delete("/cache/clear")
-async def clear_cache():
-    # Clear the cache (for admin use)
-    # Note: This is a simplified implementation
-    # In a real app, you would add authentication
+@router.delete("/cache/clear", dependencies=[Depends(require_admin_key)])
+async def clear_cache(prefix: Optional[str] = None):
+    # Clear cached entries for one entity prefix (e.g. "staff"), or all of them
+    if prefix is not None and prefix not in cache_service._PREFIXES:
+        raise HTTPException(status_code=400, detail=f"Unknown cache prefix: {prefix}")
+    
     try:
-        # For memory cache, we can't easily clear all keys
-        # For Redis, we could use FLUSHDB, but that's dangerous
-        # Instead, we'll just log that this endpoint was called
-        logger.info("Cache clear requested")
-        return {"message": "Cache clear requested"}
+        deleted = await cache_service.clear(prefix)
+        # The staff service index is derived from businesses and services
+        if prefix in ("businesses", "services"):
+            deleted += await cache_service.clear("index")
+        logger.info(f"Cleared {deleted} cache entries for prefix {prefix or '*'}")
+        return {"message": "Cache cleared", "prefix": prefix, "deleted": deleted}
     except Exception as e:
         logger.error(f"Failed to clear cache: {e}")
         raise HTTPException(
@@ -367,23 +509,45 @@ class ErrorResponse(BaseModel):
     "app/services/__init__.py": """# Services package""",
     
     "app/services/graph_service.py": """# Microsoft Graph API service for accessing Booking data
+import asyncio
 import logging
 from typing import Dict, List, Optional, Any, Tuple
 
+import httpx
 from azure.identity import UsernamePasswordCredential
-from msgraph import GraphServiceClient
+from kiota_authentication_azure.azure_identity_authentication_provider import AzureIdentityAuthenticationProvider
+from msgraph import GraphRequestAdapter, GraphServiceClient
+from msgraph_core import GraphClientFactory
 
 from app.config import settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of concurrent Graph requests per fan-out, to stay clear of throttling
+GRAPH_MAX_CONCURRENCY = 16
+
+# Graph JSON batching endpoint and its per-request limit
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+GRAPH_BATCH_URL = "https://graph.microsoft.com/v1.0/$batch"
+GRAPH_BATCH_SIZE = 20
+
 class GraphService:
     # Service for interacting with Microsoft Graph API
     
     def __init__(self):
-        # Initialize the Graph service with credentials
+        # Initialize the Graph service with credentials and a pooled HTTP client
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            http2=True,
+            timeout=10.0
+        )
         self.client = self._create_graph_client()
+        self.semaphore = asyncio.Semaphore(GRAPH_MAX_CONCURRENCY)
+    
+    async def close(self):
+        # Close the pooled HTTP client
+        await self.http_client.aclose()
     
     def _create_graph_client(self) -> GraphServiceClient:
         # Create a Microsoft Graph client using username/password authentication
@@ -394,18 +558,24 @@ class GraphService:
                 raise ValueError("Missing required Microsoft Graph API credentials")
             
             # Define the scopes
-            scopes = ["https://graph.microsoft.com/.default"]
+            scopes = [GRAPH_SCOPE]
             
             # Create the credential
-            credential = UsernamePasswordCredential(
+            # azure.identity.aio has no username/password credential; MSAL caches
+            # the token so only the periodic refresh is a blocking call
+            credential = self.credential = UsernamePasswordCredential(
                 client_id=settings.ms_client_id,
                 username=settings.ms_username,
                 password=settings.ms_password,
                 tenant_id=settings.ms_tenant_id
             )
             
-            # Create the Graph client - updated for msgraph-sdk 1.26.0
-            graph_client = GraphServiceClient(credentials=credential)
+            # Create the Graph client on the shared HTTP client, keeping the SDK's default
+            # retry/redirect middleware - updated for msgraph-sdk 1.26.0
+            auth_provider = AzureIdentityAuthenticationProvider(credential, scopes=scopes)
+            http_client = GraphClientFactory.create_with_default_middleware(client=self.http_client)
+            request_adapter = GraphRequestAdapter(auth_provider, http_client)
+            graph_client = GraphServiceClient(request_adapter=request_adapter)
             
             return graph_client
         
@@ -413,11 +583,68 @@ class GraphService:
             logger.error(f"Failed to create Graph client: {e}")
             raise
     
-    def get_booking_businesses(self) -> List[Dict[str, Any]]:
+    async def _bounded(self, coro):
+        # Run a Graph call while holding a concurrency slot
+        async with self.semaphore:
+            return await coro
+    
+    async def _batch(self, urls: List[str]) -> List[Optional[Dict[str, Any]]]:
+        # Run GET requests through Graph's $batch endpoint, GRAPH_BATCH_SIZE per call
+        # Returns each sub-response in submitted order, or None where its chunk failed
+        if not urls:
+            return []
+        
+        token = await asyncio.to_thread(self.credential.get_token, GRAPH_SCOPE)
+        headers = {"Authorization": f"Bearer {token.token}"}
+        
+        async def post_chunk(chunk: List[str]) -> List[Optional[Dict[str, Any]]]:
+            body = {"requests": [{"id": str(i), "method": "GET", "url": url} for i, url in enumerate(chunk)]}
+            try:
+                response = await self.http_client.post(GRAPH_BATCH_URL, json=body, headers=headers)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error(f"Graph batch request failed: {e}")
+                return [None] * len(chunk)
+            
+            # Sub-responses may come back in any order
+            responses = {item["id"]: item for item in response.json().get("responses", [])}
+            return [responses.get(str(i)) for i in range(len(chunk))]
+        
+        chunks = [urls[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(urls), GRAPH_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._bounded(post_chunk(chunk)) for chunk in chunks))
+        return [response for chunk_results in results for response in chunk_results]
+    
+    async def _get_for_businesses(self, business_ids: List[str], resource: str, fallback) -> List[List[Dict[str, Any]]]:
+        # Get a collection (e.g. "staffMembers") for each business through $batch
+        # Sub-requests that hit a 5xx, throttling (429) or a failed chunk are retried individually with
+        # the fallback method, whose retry middleware honours Retry-After; other 4xx responses
+        # (not found, forbidden) would fail again, so they are raised instead
+        responses = await self._batch([f"/solutions/bookingBusinesses/{business_id}/{resource}" for business_id in business_ids])
+        results: List[Optional[List[Dict[str, Any]]]] = []
+        for business_id, response in zip(business_ids, responses):
+            status = response.get("status", 500) if response else 500
+            if status >= 500 or status == 429:
+                results.append(None)
+            elif status >= 400:
+                logger.error(f"Failed to get {resource} for business {business_id}: {response.get('body')}")
+                raise RuntimeError(f"Graph returned {status} for {resource} of business {business_id}: {response.get('body')}")
+            else:
+                results.append(response["body"].get("value", []))
+        
+        failed = [i for i, result in enumerate(results) if result is None]
+        if failed:
+            logger.warning(f"Batched {resource} request failed for {len(failed)} businesses, retrying individually")
+            retried = await asyncio.gather(*(self._bounded(fallback(business_ids[i])) for i in failed))
+            for i, result in zip(failed, retried):
+                results[i] = result
+        
+        return results
+    
+    async def get_booking_businesses(self) -> List[Dict[str, Any]]:
         # Get all booking businesses
         try:
             # Get booking businesses - updated for msgraph-sdk 1.26.0
-            result = self.client.booking_businesses.get()
+            result = await self.client.solutions.booking_businesses.get()
             
             # Convert to list of dictionaries
             businesses = [business.to_dict() for business in result.value]
@@ -428,11 +655,11 @@ class GraphService:
             logger.error(f"Failed to get booking businesses: {e}")
             raise
     
-    def get_staff_members(self, business_id: str) -> List[Dict[str, Any]]:
+    async def get_staff_members(self, business_id: str) -> List[Dict[str, Any]]:
         # Get staff members for a specific business
         try:
             # Get staff members for the business - updated for msgraph-sdk 1.26.0
-            result = self.client.booking_businesses.by_booking_business_id(business_id).staff_members.get()
+            result = await self.client.solutions.booking_businesses.by_booking_business_id(business_id).staff_members.get()
             
             # Convert to list of dictionaries
             staff_members = [staff.to_dict() for staff in result.value]
@@ -443,11 +670,11 @@ class GraphService:
             logger.error(f"Failed to get staff members for business {business_id}: {e}")
             raise
     
-    def get_services(self, business_id: str) -> List[Dict[str, Any]]:
+    async def get_services(self, business_id: str) -> List[Dict[str, Any]]:
         # Get services for a specific business
         try:
             # Get services for the business - updated for msgraph-sdk 1.26.0
-            result = self.client.booking_businesses.by_booking_business_id(business_id).services.get()
+            result = await self.client.solutions.booking_businesses.by_booking_business_id(business_id).services.get()
             
             # Convert to list of dictionaries
             services = [service.to_dict() for service in result.value]
@@ -462,23 +689,30 @@ class GraphService:
             logger.error(f"Failed to get services for business {business_id}: {e}")
             raise
     
-    def find_staff_member_by_email(self, email: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    async def find_staff_member_by_email(
+        self,
+        email: str,
+        businesses: Optional[List[Dict[str, Any]]] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
         # Find a staff member by email across all businesses
         try:
-            # Get all booking businesses
-            businesses = self.get_booking_businesses()
+            # Get all booking businesses unless the caller already has them
+            if businesses is None:
+                businesses = await self.get_booking_businesses()
+            
+            # Get staff members for all businesses in batched requests
+            staff_lists = await self._get_for_businesses(
+                [business["id"] for business in businesses], "staffMembers", self.get_staff_members
+            )
             
             # Search for the staff member in each business
-            for business in businesses:
-                business_id = business["id"]
-                
-                # Get staff members for this business
-                staff_members = self.get_staff_members(business_id)
-                
+            email_lc = email.lower()
+            for business, staff_members in zip(businesses, staff_lists):
                 # Look for the staff member with the matching email
                 for staff in staff_members:
-                    if staff.get("emailAddress", "").lower() == email.lower():
-                        return staff, business_id
+                    address = staff.get("emailAddress")
+                    if address and address.lower() == email_lc:
+                        return staff, business["id"]
             
             # Staff member not found
             return None, None
@@ -487,41 +721,61 @@ class GraphService:
             logger.error(f"Failed to find staff member by email {email}: {e}")
             raise
     
-    def get_services_for_staff(self, staff_id: str) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
-        # Get services for a specific staff member across all businesses
+    async def build_staff_service_index(
+        self,
+        businesses: Optional[List[Dict[str, Any]]] = None,
+        known_services: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> Dict[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]]:
+        # Build a reverse index of staff ID to (service, business) pairs across all businesses
+        # known_services maps business ID to services the caller already has (e.g. from cache)
         try:
-            # Get all booking businesses
-            businesses = self.get_booking_businesses()
-            businesses_dict = {b["id"]: b for b in businesses}
+            # Get all booking businesses unless the caller already has them
+            if businesses is None:
+                businesses = await self.get_booking_businesses()
+            services_by_business = dict(known_services or {})
             
-            # Get services for each business and filter for this staff member
-            staff_services = []
-            
-            for business_id in businesses_dict:
-                # Get services for this business
-                services = self.get_services(business_id)
-                
-                # Filter services for this staff member
+            # Get services for the remaining businesses in batched requests
+            missing_ids = [b["id"] for b in businesses if b["id"] not in services_by_business]
+            services_lists = await self._get_for_businesses(missing_ids, "services", self.get_services)
+            for business_id, services in zip(missing_ids, services_lists):
+                # Add business ID to each service for reference, as get_services does
                 for service in services:
-                    staff_member_ids = service.get("staffMemberIds", [])
-                    if staff_id in staff_member_ids:
-                        staff_services.append((service, businesses_dict[business_id]))
+                    service["businessId"] = business_id
+                services_by_business[business_id] = services
+            
+            # Invert service -> staff members into staff member -> services in one pass
+            index: Dict[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]] = {}
+            for business in businesses:
+                for service in services_by_business[business["id"]]:
+                    for staff_id in service.get("staffMemberIds") or []:
+                        index.setdefault(staff_id, []).append((service, business))
             
-            return staff_services
+            return index
         
         except Exception as e:
-            logger.error(f"Failed to get services for staff {staff_id}: {e}")
-            raise""",
+            logger.error(f"Failed to build staff service index: {e}")
+            raise
+    
+    async def get_services_for_staff(
+        self,
+        staff_id: str,
+        businesses: Optional[List[Dict[str, Any]]] = None,
+        known_services: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        # Get services for a specific staff member across all businesses
+        index = await self.build_staff_service_index(businesses, known_services)
+        return index.get(staff_id, [])""",
     
     "app/services/cache_service.py": """# Cache service for caching API responses
-import json
 import logging
-import time
+import math
 import os
-from typing import Any, Dict, Optional, List
+import time
+from typing import Any, Dict, Optional, List, Tuple
 from abc import ABC, abstractmethod
-import redis
-from collections import OrderedDict
+import orjson
+import redis.asyncio as aioredis
+from cachetools import TLRUCache
 
 from app.config import settings
 
@@ -531,29 +785,47 @@ logger = logging.getLogger(__name__)
 # Cache interface
 class CacheInterface(ABC):
     # Abstract base class for cache implementations
+    # Values are stored as serialized JSON bytes so hits can be returned as-is
+    
+    # Known cache key prefixes
+    _PREFIXES = frozenset({"businesses", "staff", "services", "staff_services", "index"})
     
     @abstractmethod
-    def get(self, key: str) -> Optional[Any]:
-        # Get data from cache
+    async def get(self, key: str) -> Optional[bytes]:
+        # Get serialized data from cache
         pass
     
     @abstractmethod
-    def set(self, key: str, data: Any, expire_seconds: Optional[int] = None) -> bool:
-        # Set data in cache with expiration
+    async def set(self, key: str, data: Any, expire_seconds: Optional[int] = None) -> bool:
+        # Serialize data and set it in cache with expiration
+        pass
+    
+    @abstractmethod
+    async def get_many(self, keys: List[str]) -> Dict[str, Optional[bytes]]:
+        # Get serialized data for several keys in one round-trip
         pass
     
     @abstractmethod
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         # Delete data from cache
         pass
     
+    @abstractmethod
+    async def clear(self, prefix: Optional[str] = None) -> int:
+        # Delete all keys with the given prefix (all known prefixes if None), returning the count
+        pass
+    
     def get_key(self, prefix: str, identifier: str) -> str:
         # Generate a cache key
+        # Emails are case-insensitive, so fold them to avoid duplicate entries
+        assert prefix in self._PREFIXES, f"Unknown cache key prefix: {prefix}"
+        if prefix == "staff_services":
+            identifier = identifier.lower()
         return f"{prefix}:{identifier}"
 
 # In-memory cache implementation
 class MemoryCache(CacheInterface):
-    # Simple in-memory cache using OrderedDict
+    # In-memory cache with LRU eviction and per-entry expiry, backed by cachetools
     
     def __init__(self, max_size: int = 0):
         # Initialize in-memory cache
@@ -561,11 +833,13 @@ class MemoryCache(CacheInterface):
         #   max_size: Maximum number of items to store in cache (0 = unlimited)
         #
         # The max_size parameter controls how many items can be stored in the cache.
-        # When set to a positive number, the cache will remove the oldest items
-        # when it reaches this limit. This prevents memory usage from growing indefinitely.
+        # When set to a positive number, the cache will remove the least recently used
+        # items when it reaches this limit. Expired items are purged before any LRU
+        # eviction, so live entries are never pushed out by stale ones.
         # When set to 0, the cache has no size limit (use with caution).
         
-        self.cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # Entries are stored as (expires_monotonic, data) tuples so each key carries its own deadline
+        self.cache: TLRUCache = TLRUCache(maxsize=max_size or 2**31, ttu=self._time_to_use, timer=time.monotonic)
         self.max_size = max_size
         
         if max_size > 0:
@@ -573,62 +847,60 @@ class MemoryCache(CacheInterface):
         else:
             logger.info("In-memory cache initialized with no size limit")
     
-    def get(self, key: str) -> Optional[Any]:
-        # Get data from cache
+    @staticmethod
+    def _time_to_use(key: str, value: Tuple[float, bytes], now: float) -> float:
+        # Expiration time for an entry, computed when it was set
+        return value[0]
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        # Get serialized data from cache
         try:
-            if key in self.cache:
-                item = self.cache[key]
-                # Check if item has expired
-                if item["expires"] > time.time() or item["expires"] == 0:
-                    # Move to end (most recently used)
-                    self.cache.move_to_end(key)
-                    return item["data"]
-                else:
-                    # Remove expired item
-                    self.delete(key)
-            return None
+            item = self.cache.get(key)
+            return item[1] if item is not None else None
         except Exception as e:
             logger.error(f"Memory cache retrieval error: {e}")
             return None
     
-    def set(self, key: str, data: Any, expire_seconds: Optional[int] = None) -> bool:
+    async def get_many(self, keys: List[str]) -> Dict[str, Optional[bytes]]:
+        # Get serialized data for several keys
+        return {key: await self.get(key) for key in keys}
+    
+    async def set(self, key: str, data: Any, expire_seconds: Optional[int] = None) -> bool:
         # Set data in cache with expiration
         try:
             # Use default TTL if not specified
             if expire_seconds is None:
                 expire_seconds = settings.cache_ttl_seconds
             
-            # Calculate expiration time
-            expires = time.time() + expire_seconds if expire_seconds > 0 else 0
-            
-            # Add to cache
-            self.cache[key] = {
-                "data": data,
-                "expires": expires
-            }
-            
-            # Move to end (most recently used)
-            self.cache.move_to_end(key)
-            
-            # Remove oldest items if cache is too large and max_size is set
-            if self.max_size > 0:
-                while len(self.cache) > self.max_size:
-                    self.cache.popitem(last=False)
+            # Calculate expiration time on the monotonic clock (0 = never expires)
+            expires = time.monotonic() + expire_seconds if expire_seconds > 0 else math.inf
             
+            self.cache[key] = (expires, orjson.dumps(data))
             return True
         except Exception as e:
             logger.error(f"Memory cache storage error: {e}")
             return False
     
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         # Delete data from cache
         try:
-            if key in self.cache:
-                del self.cache[key]
+            self.cache.pop(key, None)
             return True
         except Exception as e:
             logger.error(f"Memory cache deletion error: {e}")
             return False
+    
+    async def clear(self, prefix: Optional[str] = None) -> int:
+        # Delete all keys with the given prefix (all keys if None)
+        if prefix is None:
+            count = len(self.cache)
+            self.cache.clear()
+            return count
+        
+        # A full scan is fine for an admin endpoint and needs no index kept in sync with evictions
+        key_prefix = f"{prefix}:"
+        keys = [key for key in list(self.cache.keys()) if key.startswith(key_prefix)]
+        return sum(self.cache.pop(key, None) is not None for key in keys)
 
 # Redis cache implementation
 class RedisCache(CacheInterface):
@@ -637,27 +909,38 @@ class RedisCache(CacheInterface):
     def __init__(self, redis_url: str):
         # Initialize Redis client
         try:
-            self.redis_client = redis.from_url(redis_url)
+            self.redis_client = aioredis.from_url(redis_url, decode_responses=False)
             logger.info("Redis cache initialized")
         except Exception as e:
             logger.error(f"Failed to initialize Redis: {e}")
             self.redis_client = None
     
-    def get(self, key: str) -> Optional[Any]:
-        # Get data from cache
+    async def get(self, key: str) -> Optional[bytes]:
+        # Get serialized data from cache
         if not self.redis_client:
             return None
         
         try:
-            data = self.redis_client.get(key)
-            if data:
-                return json.loads(data)
+            return await self.redis_client.get(key)
         except Exception as e:
             logger.error(f"Redis cache retrieval error: {e}")
         
         return None
     
-    def set(self, key: str, data: Any, expire_seconds: Optional[int] = None) -> bool:
+    async def get_many(self, keys: List[str]) -> Dict[str, Optional[bytes]]:
+        # Get serialized data for several keys with a single MGET
+        if not self.redis_client or not keys:
+            return dict.fromkeys(keys)
+        
+        try:
+            values = await self.redis_client.mget(keys)
+            return dict(zip(keys, values))
+        except Exception as e:
+            logger.error(f"Redis cache bulk retrieval error: {e}")
+        
+        return dict.fromkeys(keys)
+    
+    async def set(self, key: str, data: Any, expire_seconds: Optional[int] = None) -> bool:
         # Set data in cache with expiration
         if not self.redis_client:
             return False
@@ -667,29 +950,56 @@ class RedisCache(CacheInterface):
             if expire_seconds is None:
                 expire_seconds = settings.cache_ttl_seconds
             
-            self.redis_client.setex(key, expire_seconds, json.dumps(data))
+            await self.redis_client.setex(key, expire_seconds, orjson.dumps(data))
             return True
         except Exception as e:
             logger.error(f"Redis cache storage error: {e}")
             return False
     
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         # Delete data from cache
         if not self.redis_client:
             return False
         
         try:
-            self.redis_client.delete(key)
+            await self.redis_client.delete(key)
             return True
         except Exception as e:
             logger.error(f"Redis cache deletion error: {e}")
             return False
+    
+    async def clear(self, prefix: Optional[str] = None) -> int:
+        # Delete all keys with the given prefix using SCAN + UNLINK, so Redis never blocks
+        # Without a prefix, only this service's known prefixes are cleared, not the whole database
+        if not self.redis_client:
+            return 0
+        
+        count = 0
+        for current in ([prefix] if prefix is not None else sorted(self._PREFIXES)):
+            cursor = 0
+            while True:
+                cursor, keys = await self.redis_client.scan(cursor, match=f"{current}:*", count=500)
+                if keys:
+                    count += await self.redis_client.unlink(*keys)
+                if cursor == 0:
+                    break
+        return count
 
 # Factory function to create the appropriate cache service
 def create_cache_service() -> CacheInterface:
     # Create cache service based on configuration
     cache_type = settings.cache_type.lower()
     
+    # Each worker process has its own memory cache, so share Redis between workers when possible
+    # An explicit CACHE_TYPE=memory is respected; only the default is promoted
+    workers = int(os.environ.get("WORKERS") or os.environ.get("WEB_CONCURRENCY", "1"))
+    if cache_type == "memory" and workers > 1:
+        if settings.redis_url and "cache_type" not in settings.model_fields_set:
+            logger.warning(f"In-memory cache is per process but {workers} workers are configured. Using Redis cache instead.")
+            cache_type = "redis"
+        else:
+            logger.warning(f"In-memory cache is per process but {workers} workers are configured. Set CACHE_TYPE=redis and REDIS_URL to share the cache.")
+    
     if cache_type == "redis" and settings.redis_url:
         logger.info("Using Redis cache")
         return RedisCache(settings.redis_url)
@@ -712,22 +1022,21 @@ cache_service = create_cache_service()""",
 from typing import Dict, List, Any
 
 def group_services_by_business(services_with_businesses: List[tuple]) -> List[Dict[str, Any]]:
-    # Group services by business
-    
-    # Group services by business ID
-    services_by_business = {}
+    # Group services by business in a single pass, preserving first-seen business order
+    services_by_business: Dict[str, Dict[str, Any]] = {}
     
     for service, business in services_with_businesses:
         business_id = business["id"]
+        group = services_by_business.get(business_id)
         
-        if business_id not in services_by_business:
+        if group is None:
             services_by_business[business_id] = {
                 "businessId": business_id,
                 "businessName": business["displayName"],
-                "services": []
+                "services": [service]
             }
-        
-        services_by_business[business_id]["services"].append(service)
+        else:
+            group["services"].append(service)
     
     # Convert to list
     return list(services_by_business.values())"""